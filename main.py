@@ -1,28 +1,53 @@
-import json
+import asyncio
+import atexit
+import contextlib
+import itertools
+import logging
+import secrets
+import shutil
+import tempfile
+from dataclasses import dataclass
+import sqlite3
 import subprocess
 from pathlib import Path
 import os
-import requests
+import httpx
 import sys
 import re
+import yt_dlp
+from yt_dlp.utils import DownloadError
 
-# USERNAME is not used - this script is for scraping random TWICE fan videos
-# You'll need to provide video URLs manually or modify to search by hashtag
+# Sources: video URLs / @usernames on the command line, or TIKTOK_USERNAME
+# (PipelineConfig.username) for scheduled runs without arguments
 SAVE_DIR = Path("downloads")
 SAVE_DIR.mkdir(exist_ok=True)
 
-ID_LIST_FILE = SAVE_DIR / "video_id_list.txt"
+HISTORY_DB = SAVE_DIR / "history.db"
+ID_LIST_FILE = SAVE_DIR / "video_id_list.txt"  # legacy history, imported into HISTORY_DB once
+# Reused TikTok session across runs. Only the in-process `ydl` writes it (at exit);
+# download subprocesses get a throwaway copy, see _subprocess_cookies()
+COOKIES_FILE = SAVE_DIR / "tt_cookies.txt"
+
+# yt-dlp's intermediate files (.part, fragments) go to tmpfs when available; only the
+# finished mp4 lands in SAVE_DIR (shutil's move across devices copies via os.sendfile)
+TEMP_DIR = Path("/dev/shm/tiktok") if Path("/dev/shm").is_dir() else None
+
+logger = logging.getLogger(__name__)
 
 PAGE_ACCESS_TOKEN = os.getenv("PAGE_ACCESS_TOKEN")
 PAGE_ID = os.getenv("PAGE_ID")
 
+# STREAM_UPLOAD=1: pipe yt-dlp's output straight into the Facebook upload (no mp4 on disk).
+# ⚠️ This POSTS TO FACEBOOK for real: it is not covered by the TESTING MODE gate in process_video
+STREAM_UPLOAD = os.getenv("STREAM_UPLOAD") == "1"
+
 # TWICE members list (lowercase for matching)
 TWICE_MEMBERS = [
     "nayeon", "jeongyeon", "momo", "sana", "jihyo",
     "mina", "dahyun", "chaeyoung", "tzuyu"
 ]
 
-# ✅ Official TWICE accounts to IGNORE (you have separate code for these)
+# ✅ Official TWICE accounts: ignored for fan content, the only source in official-only mode
 OFFICIAL_ACCOUNTS_TO_SKIP = [
     "twice_tiktok_official",
     "twice.official",
@@ -30,30 +55,119 @@ OFFICIAL_ACCOUNTS_TO_SKIP = [
     "twicetagram",
 ]
 
+# TWICE-specific hashtags (Korean name, official tags, albums, etc.)
+TWICE_SPECIFIC_TAGS = (
+    "트와이스", "twice_", "once", "jypentertainment", "jype",
+    "feelspecial", "fancyyou", "twicetagram", "formula_of_love",
+    "between1and2", "readytobe", "with_you_th", "celebrate",
+    "talk_that_talk", "scientist", "perfect_world", "the_feels"
+)
+
+# Group content keywords
+GROUP_KEYWORDS = (
+    "트와이스", "anniversary", "comeback", "debut",
+    "mv", "choreography", "performance", "stage", "concert",
+    "showcase", "once", "ot9", "edit", "fanmade", "cover"
+)
+
+# ✅ BLOCKLIST: Even with evidence, reject obvious spam/unrelated
+BLOCKLIST = (
+    "not twice", "vs twice", "better than twice",
+    "blackpink", "bts", "itzy", "aespa",  # other groups (unless crossover content)
+    "tutorial", "how to", "challenge",  # generic content
+    "giveaway", "contest", "follow for"  # spam
+)
+
 # Set to True to allow fan content, False to only allow official accounts
 ALLOW_FAN_CONTENT = True
 
 
-def is_twice_related(caption: str, hashtags: list, uploader: str) -> tuple[bool, str]:
+@dataclass(frozen=True)
+class PipelineConfig:
+    """Everything that differs between the official-only and fan-content variants of this bot."""
+    username: str | None = None  # profile checked when no sources are given on the command line
+    allow_fan_content: bool = ALLOW_FAN_CONTENT
+    official_accounts: frozenset = frozenset(acc.lower() for acc in OFFICIAL_ACCOUNTS_TO_SKIP)
+    required_evidence: int = 2  # fan content needs at least this many pieces of evidence
+
+
+DEFAULT_CONFIG = PipelineConfig()
+
+# Attempts per chunk for the Facebook resumable upload
+UPLOAD_CHUNK_RETRIES = 3
+
+# Read size when piping yt-dlp stdout into a streamed upload
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Precomputed once at import (set lookups + compiled regex instead of per-call rebuilds)
+_HASHTAG_RE = re.compile(r"#(\w+)")
+
+
+def _build_caption_scan():
+    """One regex covering every caption keyword, mapped back to its bucket(s)."""
+    buckets = {}
+    for bucket, words in (("members", TWICE_MEMBERS), ("keywords", GROUP_KEYWORDS), ("blocklist", BLOCKLIST)):
+        for word in words:
+            buckets.setdefault(word, []).append(bucket)
+    # Zero-width lookahead so overlapping hits (e.g. "concert" / "once") are all reported
+    alternation = "|".join(re.escape(w) for w in sorted(buckets, key=len, reverse=True))
+    return re.compile(f"(?=({alternation}))"), buckets
+
+
+_CAPTION_SCAN_RE, _CAPTION_BUCKETS = _build_caption_scan()
+
+# In-process yt-dlp (no python -m yt_dlp subprocess + JSON round-trip per call)
+YDL_OPTS = {
+    "quiet": True,
+    "skip_download": True,
+    "simulate": True,
+    "cookiefile": str(COOKIES_FILE),
+}
+ydl = yt_dlp.YoutubeDL(YDL_OPTS)
+atexit.register(ydl.close)  # writes updated cookies back to COOKIES_FILE
+
+# One long-lived HTTP/2 client: TLS + connection setup to graph.facebook.com is reused
+_HTTP = httpx.Client(http2=True, timeout=300.0)
+atexit.register(_HTTP.close)
+
+
+def is_twice_related(caption: str, uploader: str, config: PipelineConfig = DEFAULT_CONFIG) -> tuple[bool, str]:
     """
     Determine if video is TWICE-related with multiple safety checks.
+    Official-only mode (allow_fan_content=False): accepts official accounts only
     For fan content: requires STRONG evidence (multiple indicators)
-    EXCLUDES official accounts (handled by separate script)
+    EXCLUDES official accounts (handled by the official-only mode)
     Returns: (is_valid, reason)
     """
+    # Lowercase once; hashtags come out of the lowered caption already normalized
     caption_lower = caption.lower()
-    hashtags_lower = [h.lower() for h in hashtags]
+    hashtags_lower = set(_HASHTAG_RE.findall(caption_lower))
     
-    # ❌ SKIP official accounts (you have separate code for them)
-    is_official = uploader.lower() in [acc.lower() for acc in OFFICIAL_ACCOUNTS_TO_SKIP]
+    is_official = uploader.lower() in config.official_accounts
+    if not config.allow_fan_content:
+        if is_official:
+            return True, f"✅ Official account: {uploader}"
+        return False, f"⏭️ Not an official account: {uploader}"
+
+    # ❌ SKIP official accounts (handled by the official-only mode)
     if is_official:
-        return False, f"⏭️ Skipping official account: {uploader} (handled by separate script)"
+        return False, f"⏭️ Skipping official account: {uploader} (handled by official-only mode)"
     
     # ✅ MUST have #twice hashtag (basic requirement)
     has_twice_tag = "twice" in hashtags_lower
     if not has_twice_tag:
         return False, "Missing #twice hashtag"
     
+    # Single pass over the caption (member names, group keywords, blocklist) BEFORE
+    # scoring, so spam is rejected without building any evidence
+    caption_hits = {"members": [], "keywords": []}
+    for match in _CAPTION_SCAN_RE.finditer(caption_lower):
+        word = match.group(1)
+        for bucket in _CAPTION_BUCKETS[word]:
+            if bucket == "blocklist":
+                return False, f"Blocklist keyword detected: '{word}'"
+            caption_hits[bucket].append(word)
+
     # ✅ Count TWICE-related indicators (need multiple for fan content)
     evidence_count = 0
     evidence_list = []
@@ -65,154 +179,255 @@ def is_twice_related(caption: str, hashtags: list, uploader: str) -> tuple[bool,
         evidence_list.append(f"member tags: {', '.join(matching_members)}")
     
     # 2. Member names in caption (not just hashtags)
-    caption_members = [m for m in TWICE_MEMBERS if m in caption_lower]
+    caption_members = caption_hits["members"]
     if caption_members:
         evidence_count += 1
         evidence_list.append(f"members mentioned: {', '.join(set(caption_members))}")
     
-    # 3. TWICE-specific hashtags (Korean name, official tags, albums, etc.)
-    twice_specific_tags = [
-        "트와이스", "twice_", "once", "jypentertainment", "jype",
-        "feelspecial", "fancyyou", "twicetagram", "formula_of_love",
-        "between1and2", "readytobe", "with_you_th", "celebrate",
-        "talk_that_talk", "scientist", "perfect_world", "the_feels"
-    ]
-    matching_specific = [tag for tag in twice_specific_tags 
-                        if any(tag in ht for ht in hashtags_lower)]
+    # 3. TWICE-specific hashtags (substring of any hashtag; hashtags are \w+ so
+    #    a space-joined string can't create false matches across tags)
+    hashtags_joined = " ".join(hashtags_lower)
+    matching_specific = [tag for tag in TWICE_SPECIFIC_TAGS if tag in hashtags_joined]
     if matching_specific:
         evidence_count += len(matching_specific)
         evidence_list.append(f"specific tags: {', '.join(matching_specific[:3])}")
     
     # 4. Group content keywords
-    group_keywords = [
-        "트와이스", "anniversary", "comeback", "debut",
-        "mv", "choreography", "performance", "stage", "concert",
-        "showcase", "once", "ot9", "edit", "fanmade", "cover"
-    ]
-    matching_keywords = [kw for kw in group_keywords if kw in caption_lower]
+    matching_keywords = list(dict.fromkeys(caption_hits["keywords"]))
     if matching_keywords:
         evidence_count += 1
         evidence_list.append(f"keywords: {', '.join(matching_keywords[:2])}")
     
     # ✅ Fan content requires strong evidence
-    required_evidence = 2  # Require at least 2 pieces of evidence
+    required_evidence = config.required_evidence
     
     if evidence_count < required_evidence:
         return False, f"Insufficient evidence ({evidence_count}/{required_evidence}). Only generic #twice tag found"
     
-    # ✅ BLOCKLIST: Even with evidence, reject obvious spam/unrelated
-    blocklist = [
-        "not twice", "vs twice", "better than twice",
-        "blackpink", "bts", "itzy", "aespa",  # other groups (unless crossover content)
-        "tutorial", "how to", "challenge",  # generic content
-        "giveaway", "contest", "follow for"  # spam
-    ]
-    for blocked in blocklist:
-        if blocked in caption_lower:
-            return False, f"Blocklist keyword detected: '{blocked}'"
-    
     return True, f"✅ Valid TWICE fan content (evidence: {evidence_count}) - {'; '.join(evidence_list)}"
 
 
-def get_video_info(video_url: str):
+def validate_video(video_data: dict, config: PipelineConfig = DEFAULT_CONFIG):
+    """Validate already-extracted video metadata. Returns video info dict or None."""
+    caption = video_data.get("description") or ""
+    uploader = video_data.get("uploader") or video_data.get("uploader_id") or "unknown"
+
+    # 🔍 Debugging (LOGLEVEL=DEBUG); skipped entirely otherwise, including the hashtag scan
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Video ID: %s", video_data.get("id"))
+        logger.debug("Uploader: %s", uploader)
+        logger.debug("Caption: %s%s", caption[:100], "..." if len(caption) > 100 else "")
+        logger.debug("Hashtags: %s", _HASHTAG_RE.findall(caption))
+
+    # ✅ Validate if video is TWICE-related
+    is_valid, reason = is_twice_related(caption, uploader, config)
+    
+    if not is_valid:
+        print(f"⚠️ Skipping video: {reason}")
+        return None
+    
+    print(f"✅ {reason}")
+
+    return {
+        "id": video_data["id"],
+        "url": video_data["webpage_url"],
+        "caption": caption or "No caption",
+        "username": uploader
+    }
+
+
+def get_video_info(video_url: str, config: PipelineConfig = DEFAULT_CONFIG):
     """Fetch video metadata from a specific TikTok URL."""
     try:
         # Get video metadata
-        video_cmd = ["python", "-m", "yt_dlp", "-j", video_url]
-        video_result = subprocess.run(video_cmd, capture_output=True, text=True, check=True)
-        video_data = json.loads(video_result.stdout)
-
-        caption = video_data.get("description") or ""
-        uploader = video_data.get("uploader") or video_data.get("uploader_id") or "unknown"
-
-        # 🔍 Extract hashtags from caption using regex
-        hashtags = re.findall(r"#(\w+)", caption)  # Capture without #
-
-        # 🔍 Debugging
-        print("=" * 50)
-        print("DEBUG >>> Video ID:", video_data.get("id"))
-        print("DEBUG >>> Uploader:", uploader)
-        print("DEBUG >>> Caption:", caption[:100], "..." if len(caption) > 100 else "")
-        print("DEBUG >>> Hashtags:", hashtags)
-        print("=" * 50)
-
-        # ✅ Validate if video is TWICE-related
-        is_valid, reason = is_twice_related(caption, hashtags, uploader)
-        
-        if not is_valid:
-            print(f"⚠️ Skipping video: {reason}")
-            return None
-        
-        print(f"✅ {reason}")
+        video_data = ydl.extract_info(video_url, download=False)
+        return validate_video(video_data, config)
 
-        return {
-            "id": video_data["id"],
-            "url": video_data["webpage_url"],
-            "caption": caption or "No caption",
-            "username": uploader
-        }
-
-    except subprocess.CalledProcessError as e:
-        print("❌ yt-dlp error:", e.stderr)
-        return None
-    except json.JSONDecodeError as e:
-        print("❌ JSON parsing error:", str(e))
+    except DownloadError as e:
+        print("❌ yt-dlp error:", str(e))
         return None
     except Exception as e:
         print("❌ Unexpected error:", str(e))
         return None
 
 
-def get_latest_video(username: str):
+def _profile_entries(username: str):
+    """List a profile newest-first WITHOUT resolving each video (lazily paged)."""
+    data = ydl.extract_info(f"https://www.tiktok.com/@{username}", download=False, process=False)
+    extra_info = {"extractor": data.get("extractor"), "extractor_key": data.get("extractor_key")}
+
+    def entries():
+        # Later pages are fetched while iterating; a failing page ends the listing
+        try:
+            yield from (entry for entry in data.get("entries") or [] if entry)
+        except DownloadError as e:
+            print("❌ yt-dlp error while listing profile:", str(e))
+
+    return entries(), extra_info
+
+
+def get_latest_video(username: str, history: sqlite3.Connection = None,
+                     config: PipelineConfig = DEFAULT_CONFIG):
     """Fetch the latest TikTok video with full caption and hashtags extracted from caption text."""
     try:
-        # Step 1: Get latest video ID
-        playlist_cmd = [
-            "python", "-m", "yt_dlp", "-J", "--flat-playlist",
-            f"https://www.tiktok.com/@{username}"
-        ]
-        result = subprocess.run(playlist_cmd, capture_output=True, text=True, check=True)
-        data = json.loads(result.stdout)
-
-        if not data.get("entries"):
+        entries, extra_info = _profile_entries(username)
+        latest = next(entries, None)
+
+        if not latest:
             print("⚠️ No videos found.")
             return None
 
-        latest_id = data["entries"][0]["id"]
-        video_url = f"https://www.tiktok.com/@{username}/video/{latest_id}"
+        # History check first: a "no new post" run never pays for full metadata extraction
+        if history is not None and is_uploaded(history, latest["id"]):
+            print(f"⏩ Skipping: Video ({latest['id']}) already processed.")
+            return None
 
-        return get_video_info(video_url)
+        video_data = ydl.process_ie_result(latest, download=False, extra_info=extra_info)
+        return validate_video(video_data, config)
 
-    except subprocess.CalledProcessError as e:
-        print("❌ yt-dlp error:", e.stderr)
-        return None
-    except json.JSONDecodeError as e:
-        print("❌ JSON parsing error:", str(e))
+    except DownloadError as e:
+        print("❌ yt-dlp error:", str(e))
         return None
     except Exception as e:
         print("❌ Unexpected error:", str(e))
         return None
 
 
-def download_video(url: str, video_id: str):
-    """Download TikTok video to disk."""
-    video_path = SAVE_DIR / f"{video_id}.mp4"
-    cmd = ["python", "-m", "yt_dlp", "-o", str(video_path), url]
+def get_new_videos(username: str, is_known, n: int = 20,
+                   config: PipelineConfig = DEFAULT_CONFIG) -> list:
+    """List the newest `n` videos in ONE extraction and return the valid, not-yet-uploaded ones.
 
+    `is_known(video_id) -> bool` decides which IDs to skip; it lets callers keep history
+    access on their own thread while this runs in a worker.
+    """
     try:
-        subprocess.run(cmd, check=True, timeout=300)  # 5 min timeout
-        print(f"🎉 Download complete: {video_path}")
+        entries, extra_info = _profile_entries(username)
+    except DownloadError as e:
+        print("❌ yt-dlp error:", str(e))
+        return []
+    except Exception as e:
+        print("❌ Unexpected error:", str(e))
+        return []
+
+    new_videos = []
+    for entry in itertools.islice(entries, n):
+        # History check before resolving, so known IDs cost nothing
+        if is_known(entry["id"]):
+            continue
+        # One private/deleted/geo-blocked video must not end the whole batch
+        try:
+            video_data = ydl.process_ie_result(entry, download=False, extra_info=extra_info)
+            video_info = validate_video(video_data, config)
+        except KeyError as e:
+            print("❌ Incomplete video metadata:", str(e))
+            continue
+        except DownloadError as e:
+            print(f"❌ yt-dlp error ({entry['id']}):", str(e))
+            continue
+        except Exception as e:
+            print(f"❌ Unexpected error ({entry['id']}):", str(e))
+            continue
+        if video_info:
+            new_videos.append(video_info)
+
+    return new_videos
+
+
+def open_history() -> sqlite3.Connection:
+    """Open the uploaded-IDs history (indexed lookups instead of re-reading a text file every run)."""
+    is_new = not HISTORY_DB.exists()
+    conn = sqlite3.connect(HISTORY_DB)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS uploaded_ids(id TEXT PRIMARY KEY)")
+
+    # One-time import of the old text-file history
+    if is_new and ID_LIST_FILE.exists():
+        ids = [(line,) for line in ID_LIST_FILE.read_text().splitlines() if line.strip()]
+        conn.executemany("INSERT OR IGNORE INTO uploaded_ids VALUES (?)", ids)
+        conn.commit()
+
+    return conn
+
+
+def is_uploaded(history: sqlite3.Connection, video_id: str) -> bool:
+    """Check whether a video ID was already processed."""
+    return history.execute("SELECT 1 FROM uploaded_ids WHERE id = ?", (video_id,)).fetchone() is not None
+
+
+def mark_uploaded(history: sqlite3.Connection, video_id: str):
+    """Record a processed video ID."""
+    history.execute("INSERT OR IGNORE INTO uploaded_ids VALUES (?)", (video_id,))
+    history.commit()
+
+
+@contextlib.contextmanager
+def _subprocess_cookies():
+    """yt-dlp args pointing at a private copy of COOKIES_FILE.
+
+    yt-dlp rewrites its cookie file on exit; with several downloads running at once
+    (plus `ydl` at exit) the shared file would be last-writer-wins.
+    """
+    if not COOKIES_FILE.exists():
+        yield []
+        return
+    fd, path = tempfile.mkstemp(suffix=".txt")
+    os.close(fd)
+    try:
+        shutil.copyfile(COOKIES_FILE, path)
+        yield ["--cookies", path]
+    finally:
+        os.unlink(path)
+
+
+async def download_video(url: str, video_id: str):
+    """Download TikTok video to disk (non-blocking, so other candidates keep moving)."""
+    video_path = SAVE_DIR / f"{video_id}.mp4"
+
+    # Left over from a previous run whose upload failed: reuse it
+    if video_path.exists() and video_path.stat().st_size > 0:
+        print(f"♻️ Reusing existing download: {video_path}")
         return video_path
-    except subprocess.TimeoutExpired:
-        print("❌ Download timeout (5 minutes)")
-        return None
-    except subprocess.CalledProcessError as e:
-        print("❌ Download failed:", e.stderr)
+
+    # yt-dlp's default .part handling already resumes an interrupted download; don't pass
+    # --no-part, or a truncated mp4 at the final path would pass the reuse check above
+    with _subprocess_cookies() as cookie_args:
+        cmd = ["python", "-m", "yt_dlp", *cookie_args, "-o", str(video_path)]
+        if TEMP_DIR:
+            cmd += ["--paths", f"temp:{TEMP_DIR}"]
+        cmd.append(url)
+        proc = await asyncio.create_subprocess_exec(*cmd)
+
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=300)  # 5 min timeout
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            print("❌ Download timeout (5 minutes)")
+            return None
+
+    if proc.returncode != 0:
+        print(f"❌ Download failed: yt-dlp exited with {proc.returncode}")
         return None
 
+    print(f"🎉 Download complete: {video_path}")
+    return video_path
+
+
+def _graph_post(url: str, data: dict, files: dict = None, retries: int = 1) -> dict:
+    """POST to the Graph API, retrying transient failures. Raises on final failure."""
+    for attempt in range(1, retries + 1):
+        try:
+            response = _HTTP.post(url, data=data, files=files)
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPError as e:
+            if attempt == retries:
+                raise
+            print(f"⚠️ Graph API request failed ({e}), retrying ({attempt}/{retries})...")
+
 
 def post_to_facebook(video_path: Path, caption: str):
-    """Upload video to Facebook Page via Graph API."""
+    """Upload video to Facebook Page via the Graph API resumable upload (start -> transfer -> finish)."""
     if not PAGE_ACCESS_TOKEN or not PAGE_ID:
         print("❌ Facebook credentials not set")
         return False
@@ -220,53 +435,121 @@ def post_to_facebook(video_path: Path, caption: str):
     url = f"https://graph.facebook.com/v18.0/{PAGE_ID}/videos"
     
     try:
+        # 1. Start: open an upload session, Facebook tells us which byte range to send first
+        session = _graph_post(url, {
+            "upload_phase": "start",
+            "file_size": video_path.stat().st_size,
+            "access_token": PAGE_ACCESS_TOKEN,
+        })
+        session_id = session["upload_session_id"]
+        start_offset, end_offset = int(session["start_offset"]), int(session["end_offset"])
+
+        # 2. Transfer: only one chunk is in memory at a time; a failed chunk is retried, not the whole file
         with open(video_path, "rb") as video_file:
-            files = {"source": video_file}
-            data = {"description": caption, "access_token": PAGE_ACCESS_TOKEN}
-            
-            response = requests.post(url, files=files, data=data, timeout=300)
+            while start_offset < end_offset:
+                video_file.seek(start_offset)
+                chunk = video_file.read(end_offset - start_offset)
+                transfer = _graph_post(url, {
+                    "upload_phase": "transfer",
+                    "upload_session_id": session_id,
+                    "start_offset": start_offset,
+                    "access_token": PAGE_ACCESS_TOKEN,
+                }, files={"video_file_chunk": (video_path.name, chunk, "application/octet-stream")},
+                    retries=UPLOAD_CHUNK_RETRIES)
+                start_offset, end_offset = int(transfer["start_offset"]), int(transfer["end_offset"])
+
+        # 3. Finish: publish with the caption
+        result = _graph_post(url, {
+            "upload_phase": "finish",
+            "upload_session_id": session_id,
+            "description": caption,
+            "access_token": PAGE_ACCESS_TOKEN,
+        })
         
+        if result.get("success"):
+            print("✅ Uploaded to Facebook:", result)
+            return True
+        else:
+            print("❌ Upload failed:", result)
+            return False
+    except httpx.HTTPError as e:
+        response_text = e.response.text if isinstance(e, httpx.HTTPStatusError) else ""
+        print("❌ Upload error:", str(e), response_text)
+        return False
+    except (KeyError, ValueError) as e:
+        print("❌ Unexpected Graph API response:", str(e))
+        return False
+
+
+def stream_to_facebook(url: str, caption: str):
+    """Pipe yt-dlp's stdout straight into a Facebook upload, never touching disk.
+
+    The resumable upload needs file_size up front, which a pipe can't provide, so this
+    streams a chunked multipart body to the single-shot /videos endpoint instead.
+    """
+    if not PAGE_ACCESS_TOKEN or not PAGE_ID:
+        print("❌ Facebook credentials not set")
+        return False
+
+    upload_url = f"https://graph.facebook.com/v18.0/{PAGE_ID}/videos"
+    boundary = secrets.token_hex(16)
+    with _subprocess_cookies() as cookie_args:
+        proc = subprocess.Popen(
+            ["python", "-m", "yt_dlp", *cookie_args, "-o", "-", url],
+            stdout=subprocess.PIPE,
+        )
+
+        def body():
+            for name, value in (("description", caption), ("access_token", PAGE_ACCESS_TOKEN)):
+                yield (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                       f"{value}\r\n").encode()
+            yield (f'--{boundary}\r\nContent-Disposition: form-data; name="source"; filename="video.mp4"\r\n'
+                   "Content-Type: video/mp4\r\n\r\n").encode()
+            while chunk := proc.stdout.read(STREAM_CHUNK_SIZE):
+                yield chunk
+            # yt-dlp died mid-stream: abort the request instead of closing a valid multipart
+            # body around a truncated video (Facebook would publish it)
+            if proc.wait() != 0:
+                raise subprocess.CalledProcessError(proc.returncode, proc.args)
+            yield f"\r\n--{boundary}--\r\n".encode()
+
+        try:
+            response = _HTTP.post(
+                upload_url, content=body(),
+                headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+            )
+        except subprocess.CalledProcessError as e:
+            print(f"❌ Download failed: yt-dlp exited with {e.returncode}, upload aborted")
+            return False
+        except httpx.HTTPError as e:
+            print("❌ Upload error:", str(e))
+            proc.kill()
+            return False
+        finally:
+            proc.stdout.close()
+            proc.wait()
+
         if response.status_code == 200:
             print("✅ Uploaded to Facebook:", response.json())
             return True
         else:
             print("❌ Upload failed:", response.text)
             return False
-    except requests.exceptions.RequestException as e:
-        print("❌ Upload error:", str(e))
-        return False
 
 
-if __name__ == "__main__":
-    print("🚀 Starting TWICE video checker...")
-    
-    # Method 1: Check a specific video URL
-    if len(sys.argv) > 1:
-        video_url = sys.argv[1]
-        print(f"📹 Checking video: {video_url}")
-        video_info = get_video_info(video_url)
-    else:
-        # Method 2: Check latest from a user (for testing)
-        print("ℹ️ No URL provided. Usage:")
-        print("   python main.py <tiktok_video_url>")
-        print("\nExample:")
-        print("   python main.py https://www.tiktok.com/@username/video/1234567890")
-        sys.exit(1)
-    
-    if not video_info:
-        print("ℹ️ No valid TWICE video found.")
-        sys.exit(0)
-
-    # Ensure file exists
-    if not ID_LIST_FILE.exists():
-        ID_LIST_FILE.write_text("")
+async def process_video(video_info: dict, history: sqlite3.Connection):
+    """Download (and optionally upload) one validated video.
 
-    uploaded_ids = set(ID_LIST_FILE.read_text().splitlines())
+    Failures are contained here so one bad candidate doesn't cancel the other downloads
+    running in the same TaskGroup.
+    """
+    try:
+        await _process_video(video_info, history)
+    except Exception as e:
+        print(f"❌ Failed to process video ({video_info['id']}):", str(e))
 
-    if video_info["id"] in uploaded_ids:
-        print(f"⏩ Skipping: Video ({video_info['id']}) already processed.")
-        sys.exit(0)
 
+async def _process_video(video_info: dict, history: sqlite3.Connection):
     print("🔗 Latest video URL:", video_info['url'])
     print("📝 Caption:", video_info['caption'][:200], "..." if len(video_info['caption']) > 200 else "")
     print("\n" + "="*50)
@@ -274,7 +557,15 @@ if __name__ == "__main__":
     print(video_info['url'])
     print("="*50 + "\n")
 
-    video_path = download_video(video_info["url"], video_info["id"])
+    if STREAM_UPLOAD:
+        # ⚠️ Live posting: STREAM_UPLOAD bypasses the TESTING MODE gate below
+        print("⚠️ STREAM_UPLOAD=1: posting to Facebook (testing mode does not apply)")
+        fb_caption = f"{video_info['caption']}\n\ncrdts : {video_info['username']}"
+        if await asyncio.to_thread(stream_to_facebook, video_info["url"], fb_caption):
+            mark_uploaded(history, video_info["id"])  # nothing on disk to clean up
+        return
+
+    video_path = await download_video(video_info["url"], video_info["id"])
     if video_path and video_path.exists():
         print("✅ Video downloaded successfully!")
         print(f"📁 Saved to: {video_path}")
@@ -283,10 +574,9 @@ if __name__ == "__main__":
         # Uncomment below to enable Facebook posting
         """
         fb_caption = f"{video_info['caption']}\n\ncrdts : {video_info['username']}"
-        if post_to_facebook(video_path, fb_caption):
-            # Append video ID to history
-            with open(ID_LIST_FILE, "a") as f:
-                f.write(video_info["id"] + "\n")
+        if await asyncio.to_thread(post_to_facebook, video_path, fb_caption):
+            # Record video ID in history
+            mark_uploaded(history, video_info["id"])
 
             video_path.unlink()  # cleanup
             print("🧹 Cleaned up local file.")
@@ -296,8 +586,73 @@ if __name__ == "__main__":
         
         # For testing: just mark as processed without uploading
         print("ℹ️ Skipping Facebook upload (testing mode)")
-        with open(ID_LIST_FILE, "a") as f:
-            f.write(video_info["id"] + "\n")
+        mark_uploaded(history, video_info["id"])
         print("✅ Video ID added to history")
+
+
+async def run(sources: list, config: PipelineConfig = DEFAULT_CONFIG):
+    """Validate candidates one after another while earlier ones download concurrently.
+
+    Each source is either a video URL or "@username" (newest uploads, one extraction).
+    With no sources, config.username is checked.
+    """
+    if not sources and config.username:
+        sources = [f"@{config.username}"]
+
+    history = open_history()
+    queued = set()  # IDs already handed to a download task this run
+    loop = asyncio.get_running_loop()
+
+    async def _is_known(video_id: str) -> bool:
+        return video_id in queued or is_uploaded(history, video_id)
+
+    def is_known_threadsafe(video_id: str) -> bool:
+        # Called from the extraction worker; the history lookup itself runs on the loop
+        # thread, same as mark_uploaded() in process_video
+        return asyncio.run_coroutine_threadsafe(_is_known(video_id), loop).result()
+
+    try:
+        async with asyncio.TaskGroup() as tg:
+            for source in sources:
+                # yt-dlp extraction is blocking; run it off the loop so downloads keep going
+                if source.startswith("@"):
+                    print(f"👤 Checking new videos from: {source}")
+                    candidates = await asyncio.to_thread(get_new_videos, source[1:], is_known_threadsafe, config=config)
+                else:
+                    print(f"📹 Checking video: {source}")
+                    video_info = await asyncio.to_thread(get_video_info, source, config)
+                    candidates = [video_info] if video_info else []
+
+                if not candidates:
+                    print("ℹ️ No valid TWICE video found.")
+                    continue
+
+                for video_info in candidates:
+                    if await _is_known(video_info["id"]):
+                        print(f"⏩ Skipping: Video ({video_info['id']}) already processed.")
+                        continue
+
+                    queued.add(video_info["id"])
+                    tg.create_task(process_video(video_info, history))
+    finally:
+        history.close()  # checkpoints the WAL back into history.db
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOGLEVEL", "INFO"), format="%(levelname)s >>> %(message)s")
+    print("🚀 Starting TWICE video checker...")
     
+    config = PipelineConfig(username=os.getenv("TIKTOK_USERNAME"))
+
+    # Check specific video URLs and/or new uploads from @usernames (or TIKTOK_USERNAME)
+    if len(sys.argv) < 2 and not config.username:
+        print("ℹ️ No URL provided. Usage:")
+        print("   python main.py <tiktok_video_url | @username> [...]")
+        print("\nExample:")
+        print("   python main.py https://www.tiktok.com/@username/video/1234567890")
+        print("   python main.py @username")
+        print("\nSet STREAM_UPLOAD=1 to stream straight to Facebook (posts for real, ignores testing mode)")
+        sys.exit(1)
+
+    asyncio.run(run(sys.argv[1:], config))
     print("✨ Process complete!")